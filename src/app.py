@@ -22,6 +22,7 @@ class App:
     def __init__(self):
         self.running = True
         self.watcher: FileWatcher | None = None
+        self.uploader = None  # Set once the uploader thread has started
         self._last_full_scan_date: str | None = None
         self._is_scanning = False
         self._scan_lock = threading.Lock()
@@ -44,10 +45,15 @@ class App:
                     f"{unchanged} unchanged, {errors} errors"
                 )
             if registered > 0:
-                pass
+                self._wake_uploader()
         except Exception as e:
             logger.error(f"Error processing watcher events: {e}", exc_info=True)
 
+    def _wake_uploader(self):
+        """New content was registered: start uploading now rather than at the next idle poll."""
+        if self.uploader:
+            self.uploader.wake()
+
     def _should_run_scheduled_scan(self) -> bool:
         """Check if it's time for daily scheduled full scan."""
         # Don't run if another scan is in progress
@@ -74,7 +80,10 @@ class App:
 
         logger.info(f"Starting full scan ({reason})...")
         try:
-            stats = run_full_scan(settings.SYNC_SOURCE_PATHS, settings.SYNC_WORKERS, settings.FORCE_METADATA_UPDATE)
+            stats = run_full_scan(
+                settings.SYNC_SOURCE_PATHS, settings.SYNC_WORKERS,
+                settings.FORCE_METADATA_UPDATE, settings.SCAN_WORKERS,
+            )
             self._last_full_scan_date = datetime.now().strftime("%Y-%m-%d")
             logger.info(
                 f"Full scan complete: {stats.registered} registered, {stats.updated} updated, "
@@ -82,7 +91,7 @@ class App:
                 f"{stats.errors} errors in {stats.duration_human}"
             )
             if stats.registered > 0:
-                pass
+                self._wake_uploader()
         except Exception as e:
             logger.error(f"Full scan failed: {e}", exc_info=True)
         finally:
@@ -95,6 +104,7 @@ class App:
         
         # Reset any uploads that were stuck in 'uploading' from previous run
         uploader.reset_stuck_uploads()
+        self.uploader = uploader
         
         while self.running:
             try:
@@ -116,8 +126,8 @@ class App:
 
         logger.info("FileMetadataSync starting (CAS Hybrid Mode)")
         logger.info(f"Source paths: {settings.SYNC_SOURCE_PATHS}")
-        logger.info(f"Bucket: {settings.S3_BUCKET}")
-        logger.info(f"Workers: {settings.SYNC_WORKERS}")
+        logger.info(f"Bucket: {settings.S3_BUCKET} (upload concurrency: {settings.UPLOAD_CONCURRENCY})")
+        logger.info(f"Workers: {settings.SYNC_WORKERS} (scan listing: {settings.SCAN_WORKERS})")
         logger.info(f"Full scan hour: {settings.FULL_SCAN_HOUR}:00")
 
         try:
@@ -136,7 +146,8 @@ class App:
                 source_paths=settings.SYNC_SOURCE_PATHS,
                 on_events_ready=self._on_watcher_events,
                 debounce_seconds=settings.DEBOUNCE_SECONDS,
-                ignore_patterns=settings.IGNORE_PATTERNS
+                ignore_patterns=settings.IGNORE_PATTERNS,
+                max_events=settings.WATCHER_MAX_EVENTS
             )
             self.watcher.start()
 
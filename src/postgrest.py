@@ -1,26 +1,93 @@
 """PostgREST client for database operations."""
+import re
 import httpx
-from typing import Optional
-from datetime import datetime, timezone
+from dataclasses import dataclass
+from typing import Iterator, Optional
+from urllib.parse import quote
+from datetime import datetime, timedelta, timezone
 
 from src import settings
 from src.logging_conf import logger
 
 # Timeout for DB operations
 CLIENT_TIMEOUT = 120.0
+# Max URL-encoded length of one in.() filter (path lookups, id PATCHes): proxies in
+# front of PostgREST (nginx/Kong) commonly reject request lines over 8KB with 414
+MAX_IN_FILTER_LENGTH = 4000
+KNOWN_FILE_SELECT = "id,full_path,content_hash,fs_mtime,size_bytes:filesystem_attributes->size_bytes"
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_FRACTION_RE = re.compile(r"\.(\d+)")
+
+
+def timestamp_to_micros(value: Optional[str]) -> Optional[int]:
+    """Convert a PostgREST timestamp string to integer epoch microseconds."""
+    if not value:
+        return None
+    # Postgres trims trailing zeros of the fraction; older Pythons only parse 3 or 6 digits
+    value = _FRACTION_RE.sub(lambda m: "." + m.group(1).ljust(6, "0")[:6], value, count=1)
+    try:
+        dt = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return (dt - _EPOCH) // timedelta(microseconds=1)
+
+
+@dataclass(slots=True)
+class KnownFile:
+    """A live row of the files table, as much of it as the scanner needs."""
+    id: Optional[int | str]  # files primary key (serial or uuid); only ever echoed back in filters
+    content_hash: bytes  # 32-byte digest
+    fs_mtime_us: Optional[int]  # fs_mtime as epoch microseconds
+    size_bytes: Optional[int]
+
+    @classmethod
+    def from_row(cls, row: dict) -> "KnownFile":
+        """Build from a files row selected with KNOWN_FILE_SELECT."""
+        return cls(
+            id=row["id"],
+            content_hash=bytes.fromhex(row["content_hash"]),
+            fs_mtime_us=timestamp_to_micros(row["fs_mtime"]),
+            size_bytes=row["size_bytes"],
+        )
+
+
+def in_filter_chunks(values: list[str]) -> Iterator[list[str]]:
+    """Split in.() filter values into chunks whose URL-encoded filter stays under MAX_IN_FILTER_LENGTH."""
+    chunk, size = [], len("in.()")
+    for value in values:
+        length = len(quote(value, safe="")) + 3  # plus the encoded comma
+        if chunk and size + length > MAX_IN_FILTER_LENGTH:
+            yield chunk
+            chunk, size = [], len("in.()")
+        chunk.append(value)
+        size += length
+    if chunk:
+        yield chunk
+
+
+def quote_filter_value(value: str) -> str:
+    """Quote a value for a PostgREST in.() list (paths may contain commas, parens, quotes)."""
+    return '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
 
 
 class PostgRESTClient:
     """HTTP client for PostgREST API with FMS service authentication."""
     
-    def __init__(self):
+    def __init__(self, keepalive_expiry: float = 5.0):
         self.base_url = settings.POSTGREST_URL
         self.headers = {
             "X-API-Key": settings.FMS_SERVICE_SECRET,
             "Content-Type": "application/json",
             "Prefer": "return=representation",
         }
-        self._client = httpx.Client(timeout=CLIENT_TIMEOUT)
+        # One client is shared by all scan worker threads; HTTP/2 lets them
+        # multiplex requests over a single TLS connection
+        self._client = httpx.Client(
+            timeout=CLIENT_TIMEOUT, http2=True, limits=httpx.Limits(keepalive_expiry=keepalive_expiry)
+        )
     
     def close(self):
         """Close HTTP client."""
@@ -30,38 +97,67 @@ class PostgRESTClient:
     # File Operations
     # ========================================
     
-    def fetch_path_map(self) -> dict[str, str]:
-        """Fetch all existing file paths from DB. Returns: {full_path: content_hash}"""
+    def fetch_path_map(self) -> dict[str, KnownFile]:
+        """Fetch all live (not soft-deleted) file paths from DB. Returns: {full_path: KnownFile}
+
+        Hashes are kept as 32-byte digests rather than 64-char hex strings,
+        which roughly halves the map's memory on large trees.
+        """
         path_map = {}
-        page_size = 2000
-        offset = 0
+        page_size = 5000
+        last_id = None
         
         while True:
             try:
                 url = f"{self.base_url}/files"
                 params = {
-                    "select": "full_path,content_hash",
+                    "select": KNOWN_FILE_SELECT,
+                    "deleted_at": "is.null",
                     "order": "id",  # Stable ordering for pagination
-                    "offset": offset,
                     "limit": page_size,
                 }
+                # Keyset pagination: each page is an index range scan, unlike
+                # OFFSET which re-reads all skipped rows (O(N^2) over the fetch)
+                if last_id is not None:
+                    params["id"] = f"gt.{last_id}"
                 response = self._client.get(url, headers=self.headers, params=params)
                 response.raise_for_status()
                 data = response.json()
                 
+                # Stop only on an empty page: a short page may just be PostgREST's
+                # db-max-rows cap, and the next id range still holds rows
                 if not data:
                     break
                 for row in data:
-                    path_map[row["full_path"]] = row["content_hash"]
-                if len(data) < page_size:
-                    break
-                offset += page_size
+                    if row["content_hash"]:
+                        path_map[row["full_path"]] = KnownFile.from_row(row)
+                last_id = data[-1]["id"]
             except Exception as e:
-                logger.error(f"Failed to fetch path map (offset={offset}): {e}")
+                logger.error(f"Failed to fetch path map (after id={last_id}): {e}")
                 break
         
         return path_map
     
+    def fetch_known_files(self, full_paths: list[str]) -> dict[str, KnownFile]:
+        """Fetch live DB rows for just the given paths. Returns: {full_path: KnownFile}"""
+        known = {}
+        url = f"{self.base_url}/files"
+        for chunk in in_filter_chunks([quote_filter_value(p) for p in full_paths]):
+            try:
+                params = {
+                    "select": KNOWN_FILE_SELECT,
+                    "full_path": f"in.({','.join(chunk)})",
+                    "deleted_at": "is.null",
+                }
+                response = self._client.get(url, headers=self.headers, params=params)
+                response.raise_for_status()
+                for row in response.json():
+                    if row["content_hash"]:
+                        known[row["full_path"]] = KnownFile.from_row(row)
+            except Exception as e:
+                logger.error(f"Failed to fetch {len(chunk)} known files: {e}")
+        return known
+    
     def upsert_file_contents(self, content_hash: str, size_bytes: int, mime_type: Optional[str]) -> bool:
         """Upsert into file_contents table."""
         try:
@@ -97,6 +193,34 @@ class PostgRESTClient:
             logger.error(f"Failed to upsert file {file_record.get('full_path')}: {e} | Response: {resp_body[:500]}")
             return False
     
+    def upsert_file_contents_bulk(self, rows: list[dict]) -> bool:
+        """Upsert many file_contents rows ({content_hash, size_bytes, mime_type}) in one request."""
+        try:
+            url = f"{self.base_url}/file_contents"
+            headers = {**self.headers, "Prefer": "resolution=merge-duplicates,return=minimal"}
+            now = datetime.now(timezone.utc).isoformat()
+            data = [{**row, "db_updated_at": now} for row in rows]
+            response = self._client.post(url, headers=headers, json=data)
+            response.raise_for_status()
+            return True
+        except Exception as e:
+            logger.error(f"Failed to bulk upsert {len(rows)} file_contents rows: {e}")
+            return False
+    
+    def upsert_files_bulk(self, file_records: list[dict]) -> bool:
+        """Upsert many files rows in one request (rows must share the same keys)."""
+        try:
+            url = f"{self.base_url}/files"
+            headers = {**self.headers, "Prefer": "resolution=merge-duplicates,return=minimal"}
+            params = {"on_conflict": "full_path"}
+            response = self._client.post(url, headers=headers, params=params, json=file_records)
+            response.raise_for_status()
+            return True
+        except Exception as e:
+            resp_body = getattr(getattr(e, 'response', None), 'text', 'no response body')
+            logger.error(f"Failed to bulk upsert {len(file_records)} files: {e} | Response: {resp_body[:500]}")
+            return False
+    
     def update_last_seen(self, full_path: str) -> bool:
         """Update last_seen_at for a file."""
         try:
@@ -111,24 +235,41 @@ class PostgRESTClient:
             logger.warning(f"Failed to update last_seen_at for {full_path}: {e}")
             return False
     
-    def mark_deleted(self, path_prefix: str, before_timestamp: str) -> int:
-        """Soft-delete files not seen since timestamp."""
-        try:
-            url = f"{self.base_url}/files"
-            params = {
-                "last_seen_at": f"lt.{before_timestamp}",
-                "deleted_at": "is.null",
-                "full_path": f"like.{path_prefix}*",
-            }
-            now = datetime.now(timezone.utc).isoformat()
-            data = {"deleted_at": now}
-            response = self._client.patch(url, headers=self.headers, params=params, json=data)
-            response.raise_for_status()
-            result = response.json()
-            return len(result) if result else 0
-        except Exception as e:
-            logger.error(f"Failed to soft-delete files for {path_prefix}: {e}")
-            return 0
+    def touch_last_seen(self, file_ids: list) -> int:
+        """Bulk-update last_seen_at for files by id. Returns number of ids touched."""
+        touched = 0
+        now = datetime.now(timezone.utc).isoformat()
+        url = f"{self.base_url}/files"
+        headers = {**self.headers, "Prefer": "return=minimal"}
+        for chunk in in_filter_chunks([str(fid) for fid in file_ids]):
+            try:
+                params = {"id": f"in.({','.join(chunk)})"}
+                response = self._client.patch(url, headers=headers, params=params, json={"last_seen_at": now})
+                response.raise_for_status()
+                touched += len(chunk)
+            except Exception as e:
+                logger.warning(f"Failed to update last_seen_at for {len(chunk)} files: {e}")
+        return touched
+    
+    def mark_deleted(self, file_ids: list) -> int:
+        """Soft-delete files by id. Returns number of rows marked deleted."""
+        deleted = 0
+        now = datetime.now(timezone.utc).isoformat()
+        url = f"{self.base_url}/files"
+        for chunk in in_filter_chunks([str(fid) for fid in file_ids]):
+            try:
+                params = {
+                    "id": f"in.({','.join(chunk)})",
+                    "deleted_at": "is.null",
+                    "select": "id",
+                }
+                response = self._client.patch(url, headers=self.headers, params=params, json={"deleted_at": now})
+                response.raise_for_status()
+                result = response.json()
+                deleted += len(result) if result else 0
+            except Exception as e:
+                logger.error(f"Failed to soft-delete {len(chunk)} files: {e}")
+        return deleted
     
     # ========================================
     # Upload Queue Operations (RPC)
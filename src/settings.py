@@ -27,15 +27,18 @@ FMS_SERVICE_SECRET = os.getenv("FMS_SERVICE_SECRET")
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
 S3_BUCKET = os.getenv("S3_BUCKET", "files")
+UPLOAD_CONCURRENCY = int(os.getenv("UPLOAD_CONCURRENCY", "4"))
 
 # Sync settings
 _default_sync_path = "/data"
 _env_paths = os.getenv("SYNC_SOURCE_PATHS", "")
 SYNC_SOURCE_PATHS = [p.strip() for p in _env_paths.split(",") if p.strip()] if _env_paths else [_default_sync_path]
 SYNC_WORKERS = int(os.getenv("SYNC_WORKERS", "6"))
+SCAN_WORKERS = int(os.getenv("SCAN_WORKERS", "8"))
 
 # Watcher settings
 DEBOUNCE_SECONDS = float(os.getenv("DEBOUNCE_SECONDS", "3.0"))
+WATCHER_MAX_EVENTS = int(os.getenv("WATCHER_MAX_EVENTS", "50000"))
 IGNORE_PATTERNS = [p.strip() for p in os.getenv("IGNORE_PATTERNS", "").split(",") if p.strip()] or [
     "*.tmp", "*.temp", ".DS_Store", "Thumbs.db", "*.partial",
     ".syncing", "@eaDir/*", "#recycle/*", ".SynologyWorkingDirectory/*"
@@ -77,7 +80,9 @@ if __name__ == "__main__":
         print(f"  POSTGREST_URL: {POSTGREST_URL}")
         print(f"  SUPABASE_URL: {SUPABASE_URL}")
         print(f"  S3_BUCKET: {S3_BUCKET}")
+        print(f"  UPLOAD_CONCURRENCY: {UPLOAD_CONCURRENCY}")
         print(f"  SYNC_SOURCE_PATHS: {SYNC_SOURCE_PATHS}")
         print(f"  SYNC_WORKERS: {SYNC_WORKERS}")
+        print(f"  SCAN_WORKERS: {SCAN_WORKERS}")
     except ValueError as e:
         print(f"✗ {e}")
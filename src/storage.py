@@ -0,0 +1,87 @@
+"""Supabase Storage client (object uploads over plain HTTPS)."""
+import httpx
+
+from src import settings
+from src.logging_conf import logger
+
+# Timeout for storage operations (large files on slow uplinks)
+CLIENT_TIMEOUT = 120.0
+# Idle connections outlive the uploader's 10s idle poll, so the next dequeue or
+# upload reuses the TLS session instead of handshaking again (httpx default: 5s).
+# The uploader passes this to its PostgREST client as well.
+KEEPALIVE_EXPIRY = 30.0
+
+
+class StorageClient:
+    """
+    HTTP client for the Supabase Storage API.
+
+    TODO: This uses service_role key which has full DB access.
+    Options to fix:
+    1. Direct S3/MinIO access with storage-only credentials
+    2. Pre-signed URL generation from server
+    3. Storage-only JWT token
+
+    For now, we use this for storage ONLY - DB operations go through PostgREST.
+    """
+
+    def __init__(self, max_connections: int = 10):
+        self.base_url = f"{settings.SUPABASE_URL.rstrip('/')}/storage/v1"
+        self.bucket = settings.S3_BUCKET
+        self.headers = {
+            "Authorization": f"Bearer {settings.SUPABASE_SERVICE_KEY}",
+            "apikey": settings.SUPABASE_SERVICE_KEY,
+        }
+        # One long-lived HTTP/2 connection instead of a client (and TLS
+        # handshake) per upload as with supabase-py; shared by all upload threads
+        limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        )
+        self._client = httpx.Client(timeout=CLIENT_TIMEOUT, http2=True, limits=limits)
+
+    def close(self):
+        """Close HTTP client."""
+        self._client.close()
+
+    def upload(self, path: str, content, content_type: str, upsert: bool = True) -> bool:
+        """
+        Upload an object to the bucket; content may be bytes or an iterator of chunks.
+
+        Returns False if upsert is off and the object already exists.
+        Raises httpx.HTTPStatusError on any other failure.
+        """
+        url = f"{self.base_url}/object/{self.bucket}/{path}"
+        headers = {
+            **self.headers,
+            "Content-Type": content_type,
+            "x-upsert": "true" if upsert else "false",
+        }
+        response = self._client.post(url, headers=headers, content=content)
+        # Older storage-api versions report duplicates as 400 with a 409 body
+        if not upsert and (response.status_code == 409 or (response.status_code == 400 and "Duplicate" in response.text)):
+            return False
+        response.raise_for_status()
+        return True
+
+    def exists(self, path: str) -> bool:
+        """Check whether an object exists (HEAD, no body). False on errors."""
+        try:
+            url = f"{self.base_url}/object/{self.bucket}/{path}"
+            response = self._client.head(url, headers=self.headers)
+            return response.status_code == 200
+        except Exception as e:
+            logger.warning(f"Failed to check storage object {path}: {e}")
+            return False
+
+    def delete(self, path: str) -> bool:
+        """Delete an object from the bucket."""
+        try:
+            url = f"{self.base_url}/object/{self.bucket}/{path}"
+            response = self._client.delete(url, headers=self.headers)
+            response.raise_for_status()
+            return True
+        except Exception as e:
+            logger.error(f"Failed to delete storage object {path}: {e}")
+            return False
@@ -4,23 +4,65 @@ File sync with CAS (Content-Addressable Storage) architecture.
 - S3 uploads are handled by a separate Uploader component.
 """
 import os
+import stat
 import time
+import logging
+import threading
 import hashlib
 import mimetypes
 from pathlib import Path
 from dataclasses import dataclass
-from typing import Optional
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Iterator, Optional
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
 from datetime import datetime, timezone
 
 from src import settings
 from src.logging_conf import logger
-from src.postgrest import PostgRESTClient
+from src.postgrest import PostgRESTClient, KnownFile, get_postgrest_client
+from src.watcher import PendingEvent, SourceBases
 
-HASH_CHUNK_SIZE = 65536
+HASH_CHUNK_SIZE = 1 << 20  # 1MB
+# Content hash function: its hex digest is the CAS key in file_contents and
+# storage, so scanner/watcher and uploader must all hash with the same one
+content_hasher = hashlib.sha256
 DEFAULT_WORKERS = 4
+DEFAULT_SCAN_WORKERS = 8  # directory listing threads (I/O latency bound)
+SCAN_TASK_CHUNK = 64  # files per thread pool task
+REGISTER_BATCH_SIZE = 256  # rows per bulk upsert
+SKIP_DIRS = {'@eaDir', '#recycle'}
 MAX_FILE_SIZE = 1 * 1024 * 1024 * 1024  # 1GB
 
+# Per-thread read buffer for hashing (no per-chunk bytes allocation)
+_hash_buffers = threading.local()
+
+# Lowercased extension -> MIME type, each resolved once through guess_type
+# (avoids its per-call path parsing, with the same result)
+mimetypes.init()
+EXT_TO_MIME: dict[str, str] = {
+    ext: mime for ext in {ext.lower() for ext in mimetypes.types_map}
+    if (mime := mimetypes.guess_type("x" + ext)[0])
+}
+# Suffixes guess_type rewrites (.tgz -> .tar.gz) or reads as an encoding (.gz): the
+# type then comes from the suffix before them, so these paths go through guess_type
+_MIME_FALLBACK_EXTS = frozenset(ext.lower() for ext in (*mimetypes.suffix_map, *mimetypes.encodings_map))
+# Permission bits -> "644"-style string, indexed by st_mode & 0o777
+MODE_OCTAL: tuple[str, ...] = tuple(f"{bits:03o}" for bits in range(0o1000))
+
+
+def guess_mime_type(path: str) -> str | None:
+    """Same result as mimetypes.guess_type(path)[0], from EXT_TO_MIME for all but compressed suffixes."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in _MIME_FALLBACK_EXTS:
+        return mimetypes.guess_type(path)[0]
+    return EXT_TO_MIME.get(ext)
+
+
+def format_timestamp_us(us: int) -> str:
+    """Format epoch microseconds as an ISO 8601 UTC timestamp (gmtime, no datetime objects)."""
+    secs, frac = divmod(us, 1_000_000)
+    y, mo, d, h, mi, s = time.gmtime(secs)[:6]
+    return f"{y:04d}-{mo:02d}-{d:02d}T{h:02d}:{mi:02d}:{s:02d}.{frac:06d}+00:00"
+
 
 @dataclass
 class SyncStats:
@@ -49,73 +91,287 @@ class SyncStats:
         return f"{d/3600:.1f}h"
 
 
-def validate_file_security(filepath: Path, source_base: Path) -> tuple[bool, str]:
-    """Validate file for security issues before processing."""
-    if filepath.is_symlink():
+class FileIndex:
+    """Live files rows by path, plus the set of content hashes they reference."""
+
+    def __init__(self, files: dict[str, KnownFile]):
+        self.files = files
+        # Shares the digest objects of the rows: costs only the set's table
+        self.hashes: set[bytes] = {known.content_hash for known in files.values()}
+
+    def __len__(self) -> int:
+        return len(self.files)
+
+    def get(self, full_path: str) -> KnownFile | None:
+        return self.files.get(full_path)
+
+    def add(self, full_path: str, known: KnownFile) -> None:
+        self.files[full_path] = known
+        self.hashes.add(known.content_hash)
+
+
+class RegistrationBatcher:
+    """
+    Buffers file registrations from worker threads and writes them in bulk.
+
+    One bulk upsert per REGISTER_BATCH_SIZE files replaces two round-trips
+    per file. file_contents rows are always written before the files rows
+    that reference them, and files rows whose content could not be written
+    are held back; a failed bulk write falls back to per-row upserts
+    so one bad row cannot fail the whole batch. The index is only updated
+    for rows that were actually written; rows that failed are counted per
+    action in failed, so callers can take them back out of their totals.
+    """
+
+    def __init__(self, client: PostgRESTClient, index: FileIndex, batch_size: int = REGISTER_BATCH_SIZE):
+        self.client = client
+        self.index = index
+        self.batch_size = batch_size
+        self.failed = {"registered": 0, "updated": 0}
+        self._lock = threading.Lock()
+        self._contents: dict[str, dict] = {}  # content_hash -> file_contents row
+        self._files: dict[str, tuple[dict, KnownFile, str]] = {}  # full_path -> (files row, index entry, action)
+        self._touch_ids: list = []
+
+    def add(self, contents_row: dict | None, file_record: dict, known: KnownFile, action: str) -> None:
+        """Queue a registration; flushes from the calling thread when the batch is full."""
+        with self._lock:
+            if contents_row is not None:
+                self._contents[contents_row["content_hash"]] = contents_row
+            self._files[file_record["full_path"]] = (file_record, known, action)
+            if len(self._files) < self.batch_size:
+                return
+            batch = self._take()
+        self._write(*batch)
+
+    def touch(self, known: KnownFile, full_path: str) -> None:
+        """Queue a last_seen_at update for an unchanged file."""
+        if known.id is None:
+            self.client.update_last_seen(full_path)
+            return
+        with self._lock:
+            self._touch_ids.append(known.id)
+
+    def flush(self) -> None:
+        """Write everything still buffered."""
+        with self._lock:
+            batch = self._take()
+            touch_ids, self._touch_ids = self._touch_ids, []
+        self._write(*batch)
+        if touch_ids:
+            self.client.touch_last_seen(touch_ids)
+
+    def _take(self) -> tuple[list[dict], list[tuple[dict, KnownFile, str]]]:
+        contents, files = list(self._contents.values()), list(self._files.values())
+        self._contents, self._files = {}, {}
+        return contents, files
+
+    def _write(self, contents: list[dict], files: list[tuple[dict, KnownFile, str]]) -> None:
+        missing = set()  # hashes whose file_contents row could not be written
+        if contents and not self.client.upsert_file_contents_bulk(contents):
+            for row in contents:
+                if not self.client.upsert_file_contents(row["content_hash"], row["size_bytes"], row["mime_type"]):
+                    missing.add(row["content_hash"])
+        if missing:
+            # A files row must not reference content that was never registered,
+            # and its hash must stay out of the index so a later file re-sends it
+            held = [entry for entry in files if entry[0]["content_hash"] in missing]
+            files = [entry for entry in files if entry[0]["content_hash"] not in missing]
+            with self._lock:
+                for _, _, action in held:
+                    self.failed[action] += 1
+        if not files:
+            return
+        if self.client.upsert_files_bulk([record for record, _, _ in files]):
+            written = files
+        else:
+            written = []
+            for entry in files:
+                if self.client.upsert_file(entry[0]):
+                    written.append(entry)
+                else:
+                    with self._lock:
+                        self.failed[entry[2]] += 1
+        for record, known, _ in written:
+            self.index.add(record["full_path"], known)
+
+
+def validate_file_security(filepath: str, source_base: str, st: os.stat_result | None = None) -> tuple[bool, str]:
+    """Validate file for security issues before processing (st: cached lstat, if any)."""
+    if st is None:
+        try:
+            st = os.lstat(filepath)
+        except OSError as e:
+            return False, f"cannot stat file: {e}"
+
+    # Symlink test on the lstat result: no extra syscall (a network RTT on NAS mounts)
+    if stat.S_ISLNK(st.st_mode):
         try:
-            real_path = filepath.resolve()
-            source_resolved = source_base.resolve()
-            if not str(real_path).startswith(str(source_resolved)):
+            real_path = os.path.realpath(filepath)
+            source_resolved = os.path.realpath(source_base)
+            if not real_path.startswith(source_resolved):
                 return False, f"symlink escape: {filepath} -> {real_path}"
         except (OSError, ValueError) as e:
             return False, f"symlink resolution failed: {e}"
     
-    try:
-        st = os.lstat(filepath)
-        if st.st_size > MAX_FILE_SIZE:
-            return False, f"file too large: {st.st_size / (1024**3):.2f}GB > 1GB limit"
-    except OSError as e:
-        return False, f"cannot stat file: {e}"
+    if st.st_size > MAX_FILE_SIZE:
+        return False, f"file too large: {st.st_size / (1024**3):.2f}GB > 1GB limit"
     
     return True, ""
 
 
-def compute_hash_streaming(filepath: Path) -> Optional[str]:
-    """Compute SHA256 hash without loading entire file into memory."""
+def advise_sequential(fd: int) -> None:
+    """Hint the kernel that fd is read once front to back (doubles readahead)."""
+    if hasattr(os, "posix_fadvise"):
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        except OSError:
+            pass
+
+
+def advise_dontneed(fd: int) -> None:
+    """Drop fd's pages from the page cache after a one-off read (NAS RAM is scarce)."""
+    if hasattr(os, "posix_fadvise"):
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        except OSError:
+            pass
+
+
+def _hash_buffer() -> memoryview:
+    """Return this thread's reusable HASH_CHUNK_SIZE read buffer."""
+    buf = getattr(_hash_buffers, "buf", None)
+    if buf is None:
+        buf = _hash_buffers.buf = memoryview(bytearray(HASH_CHUNK_SIZE))
+    return buf
+
+
+def compute_hash_streaming(filepath: str) -> Optional[bytes]:
+    """Compute content hash (raw digest) without loading entire file into memory."""
     try:
-        hasher = hashlib.sha256()
-        with open(filepath, 'rb') as f:
-            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
-                hasher.update(chunk)
-        return hasher.hexdigest()
+        hasher = content_hasher()
+        buf = _hash_buffer()
+        fd = os.open(filepath, os.O_RDONLY)
+        try:
+            advise_sequential(fd)
+            while (n := os.readv(fd, [buf])) > 0:
+                hasher.update(buf[:n])
+            advise_dontneed(fd)
+        finally:
+            os.close(fd)
+        return hasher.digest()
     except Exception as e:
         logger.warning(f"Failed to hash {filepath}: {e}")
         return None
 
 
-def extract_file_metadata(filepath: Path, source_base: Path) -> dict:
-    """Extract metadata using lstat() to not follow symlinks."""
+def make_metadata_extractor(source_base: str) -> Callable[[str, os.stat_result | None], dict]:
+    """
+    Build a metadata extractor specialized for one source base.
+
+    Per-scan constants (source_base, os/dict lookups) are bound once as closure
+    locals; the scan builds one extractor per source path for all its workers.
+    """
+    lstat = os.lstat
+    is_link = stat.S_ISLNK
+    splitext = os.path.splitext
+
+    def extract_file_metadata(filepath: str, st: os.stat_result | None = None) -> dict:
+        """Extract metadata using lstat() to not follow symlinks (st: cached lstat, if any)."""
+        if st is None:
+            try:
+                st = lstat(filepath)
+            except Exception as e:
+                logger.error(f"Failed to stat {filepath}: {e}")
+                return {}
+
+        fs_attributes = {
+            "size_bytes": st.st_size,
+            "mode_octal": MODE_OCTAL[st.st_mode & 0o777],
+            "uid": st.st_uid,
+            "gid": st.st_gid,
+            "is_symlink": is_link(st.st_mode),
+        }
+
+        extension = splitext(filepath)[1].lower()
+        mime_type = guess_mime_type(filepath)
+        auto_metadata = {
+            "mime_type": mime_type,
+            "extension": extension or None,
+            "original_path": filepath,
+            "source_base": source_base,
+        }
+
+        # fs_mtime derives from st_mtime_ns truncated to microseconds, the same value
+        # the scan compares against the DB to skip unchanged files
+        mtime_us = st.st_mtime_ns // 1000
+        return {
+            "fs_mtime": format_timestamp_us(mtime_us),
+            "fs_ctime": format_timestamp_us(st.st_ctime_ns // 1000),
+            "filesystem_inode": st.st_ino,
+            "filesystem_attributes": fs_attributes,
+            "auto_extracted_metadata": auto_metadata,
+            "size_bytes": st.st_size,
+            "mime_type": mime_type,
+            "mtime_us": mtime_us,
+        }
+
+    return extract_file_metadata
+
+
+def _list_directory(path: str) -> tuple[list[tuple[str, os.stat_result]], list[str]]:
+    """List one directory: (files with their lstat results, subdirectories to descend into)."""
+    files: list[tuple[str, os.stat_result]] = []
+    subdirs: list[str] = []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                name = entry.name
+                if name.startswith('.'):
+                    continue
+                try:
+                    if entry.is_dir():
+                        if name not in SKIP_DIRS and not entry.is_symlink():
+                            subdirs.append(entry.path)
+                        continue
+                    files.append((entry.path, entry.stat(follow_symlinks=False)))
+                except OSError:
+                    continue  # vanished between readdir and stat
+    except OSError as e:
+        logger.warning(f"Cannot list directory {path}: {e}")
+    return files, subdirs
+
+
+def scan_files(root: str, workers: int = DEFAULT_SCAN_WORKERS) -> Iterator[tuple[str, os.stat_result]]:
+    """
+    Walk root with os.scandir on a thread pool, yielding (path, lstat result) per file.
+
+    Each entry is stat'ed once and the result travels with the path, so later
+    steps need no further stat calls. Files are yielded a directory at a time
+    as listings complete, so the caller decides which stat results to keep
+    instead of holding one per file in the tree. Directories are listed
+    concurrently to overlap NAS readdir latency. Hidden entries and Synology
+    system folders are skipped; symlinked directories are not followed (like os.walk).
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = {executor.submit(_list_directory, root)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                dir_files, subdirs = future.result()
+                pending.update(executor.submit(_list_directory, d) for d in subdirs)
+                yield from dir_files
+
+
+def stat_regular_file(filepath: str) -> os.stat_result | None:
+    """lstat a file for processing; None if it is gone or not a regular file (or a link to one)."""
     try:
         st = os.lstat(filepath)
-    except Exception as e:
-        logger.error(f"Failed to stat {filepath}: {e}")
-        return {}
-
-    fs_attributes = {
-        "size_bytes": st.st_size,
-        "mode_octal": oct(st.st_mode)[-3:],
-        "uid": st.st_uid,
-        "gid": st.st_gid,
-        "is_symlink": filepath.is_symlink(),
-    }
-
-    mime_type, _ = mimetypes.guess_type(str(filepath))
-    auto_metadata = {
-        "mime_type": mime_type,
-        "extension": filepath.suffix.lower() if filepath.suffix else None,
-        "original_path": str(filepath),
-        "source_base": str(source_base),
-    }
-
-    return {
-        "fs_mtime": datetime.fromtimestamp(st.st_mtime, tz=timezone.utc).isoformat(),
-        "fs_ctime": datetime.fromtimestamp(st.st_ctime, tz=timezone.utc).isoformat(),
-        "filesystem_inode": st.st_ino,
-        "filesystem_attributes": fs_attributes,
-        "auto_extracted_metadata": auto_metadata,
-        "size_bytes": st.st_size,
-        "mime_type": mime_type,
-    }
+    except OSError:
+        return None
+    if stat.S_ISREG(st.st_mode) or (stat.S_ISLNK(st.st_mode) and os.path.isfile(filepath)):
+        return st
+    return None
 
 
 def normalize_path(path_str: str) -> str:
@@ -123,38 +379,58 @@ def normalize_path(path_str: str) -> str:
     return path_str if path_str.startswith('/') else '/' + path_str
 
 
-def process_single_file(filepath: Path, source_base: Path, path_map: dict, client: PostgRESTClient, force_metadata: bool = False) -> tuple[str, str, str]:
-    """Register a file in the DB: hash -> update file_contents -> update files reference."""
-    full_path = normalize_path(str(filepath))
+def process_single_file(
+    filepath: str,
+    source_base: str,
+    index: FileIndex,
+    batcher: RegistrationBatcher,
+    force_metadata: bool = False,
+    extract_metadata: Callable[[str, os.stat_result | None], dict] | None = None,
+    st: os.stat_result | None = None,
+) -> tuple[str, str, str]:
+    """Register a file in the DB: hash -> queue file_contents + files upserts on the batcher."""
+    full_path = normalize_path(filepath)
     now = datetime.now(timezone.utc).isoformat()
 
     # Security validation
-    is_safe, reason = validate_file_security(filepath, source_base)
+    is_safe, reason = validate_file_security(filepath, source_base, st)
     if not is_safe:
         logger.warning(f"Security skip: {filepath}: {reason}")
         return full_path, "skipped", reason
 
-    content_hash = compute_hash_streaming(filepath)
-    if not content_hash:
+    digest = compute_hash_streaming(filepath)
+    if not digest:
         return full_path, "error", "hash failed"
 
-    # Quick check if unchanged in local cache (skip if forcing metadata update)
-    if not force_metadata and path_map.get(full_path) == content_hash:
-        client.update_last_seen(full_path)
-        return full_path, "unchanged", "unchanged"
-
-    metadata = extract_file_metadata(filepath, source_base)
+    if extract_metadata is None:
+        extract_metadata = make_metadata_extractor(source_base)
+    metadata = extract_metadata(filepath, st)
     if not metadata:
         return full_path, "error", "metadata extraction failed"
+    size_bytes = metadata.pop("size_bytes")
+    mime_type = metadata.pop("mime_type")
+    mtime_us = metadata.pop("mtime_us")
+
+    # Quick check if unchanged in local cache (skip if forcing metadata update)
+    known = index.get(full_path)
+    content_known = not force_metadata and known is not None and known.content_hash == digest
+    if content_known and known.fs_mtime_us == mtime_us and known.size_bytes == size_bytes:
+        batcher.touch(known, full_path)
+        return full_path, "unchanged", "unchanged"
 
     try:
-        # 1. UPSERT into file_contents (Content-Addressable)
-        size_bytes = metadata.pop("size_bytes")
-        mime_type = metadata.pop("mime_type")
-        if not client.upsert_file_contents(content_hash, size_bytes, mime_type):
-            return full_path, "error", "file_contents upsert failed"
+        # 1. file_contents row (Content-Addressable)
+        # Content already referenced by any files row (this path with a new mtime,
+        # or a duplicate elsewhere) is registered; only the files row is needed
+        duplicate = not force_metadata and digest in index.hashes
+        content_hash = digest.hex()  # hex only at the DB boundary
+        contents_row = None if duplicate else {
+            "content_hash": content_hash,
+            "size_bytes": size_bytes,
+            "mime_type": mime_type,
+        }
 
-        # 2. UPSERT into files (Path reference)
+        # 2. files row (Path reference)
         file_record = {
             "full_path": full_path,
             "content_hash": content_hash,
@@ -163,122 +439,191 @@ def process_single_file(filepath: Path, source_base: Path, path_map: dict, clien
             "db_updated_at": now,
             **metadata,
         }
-        if not client.upsert_file(file_record):
-            return full_path, "error", "files upsert failed"
-            
-        # Update local map
-        path_map[full_path] = content_hash
-        
+        action = "updated" if content_known else "registered"
+        batcher.add(contents_row, file_record, KnownFile(
+            id=known.id if known else None, content_hash=digest,
+            fs_mtime_us=mtime_us, size_bytes=size_bytes,
+        ), action)
+
+        if content_known:
+            return full_path, "updated", f"metadata updated ({content_hash[:8]})"
+        if duplicate:
+            return full_path, "registered", f"registered ({content_hash[:8]}, duplicate content)"
         return full_path, "registered", f"registered ({content_hash[:8]})"
     except Exception as e:
         return full_path, "error", f"db registration failed: {e}"
 
 
-def run_full_scan(source_paths: list[str], max_workers: int = DEFAULT_WORKERS, force_metadata: bool = False) -> SyncStats:
+def run_full_scan(
+    source_paths: list[str],
+    max_workers: int = DEFAULT_WORKERS,
+    force_metadata: bool = False,
+    scan_workers: int = DEFAULT_SCAN_WORKERS,
+) -> SyncStats:
     """Full filesystem reconciliation."""
     stats = SyncStats()
     stats.start_time = time.time()
     client = PostgRESTClient()
-    scan_start = datetime.now(timezone.utc)
 
     if force_metadata:
         logger.info("Full scan: FORCE_METADATA_UPDATE enabled - will update metadata for all files")
 
     logger.info("Full scan: Loading file map from database...")
-    path_map = client.fetch_path_map()
-    logger.info(f"Full scan: Loaded {len(path_map)} existing file paths")
-
-    # Scan all source paths
-    all_files: list[tuple[Path, Path]] = []
+    index = FileIndex(client.fetch_path_map())
+    logger.info(f"Full scan: Loaded {len(index)} existing file paths")
+
+    # Scan all source paths (plain strings: no Path object per file).
+    # Files whose (size, mtime) matches the DB are unchanged and only need a
+    # last_seen_at touch, so they never reach the hashing pool. The walk is
+    # consumed as it goes: only files left to check keep their stat result.
+    all_files: list[tuple[str, str, os.stat_result]] = []
+    unchanged_ids: list = []
+    seen: set[str] = set()
+    scanned_prefixes: list[str] = []
     for source_path_str in source_paths:
-        source_path = Path(source_path_str)
-        if not source_path.exists():
+        source_path = os.path.normpath(source_path_str)
+        if not os.path.exists(source_path):
             continue
-        for root, dirs, filenames in os.walk(source_path):
-            dirs[:] = [d for d in dirs if not d.startswith('.') and d not in {'.', '@eaDir', '#recycle'}]
-            for filename in filenames:
-                if not filename.startswith('.'):
-                    all_files.append((Path(root) / filename, source_path))
-
-    stats.total_files = len(all_files)
-    logger.info(f"Full scan: Found {stats.total_files} files")
-
+        scanned_prefixes.append(normalize_path(source_path).rstrip('/') + '/')
+        for filepath, st in scan_files(source_path, scan_workers):
+            full_path = normalize_path(filepath)
+            seen.add(full_path)
+            stats.total_files += 1
+            if not force_metadata:
+                known = index.get(full_path)
+                if (known is not None and known.id is not None
+                        and st.st_size == known.size_bytes and st.st_mtime_ns // 1000 == known.fs_mtime_us):
+                    unchanged_ids.append(known.id)
+                    continue
+            all_files.append((filepath, source_path, st))
+
+    logger.info(
+        f"Full scan: Found {stats.total_files} files "
+        f"({len(unchanged_ids)} unchanged by size/mtime, {len(all_files)} to check)"
+    )
+
+    if unchanged_ids:
+        client.touch_last_seen(unchanged_ids)
+        stats.skipped_unchanged += len(unchanged_ids)
+
+    total_to_check = len(all_files)
     if all_files:
-        def worker_task(args):
-            filepath, source_base = args
-            worker_client = PostgRESTClient()
-            return process_single_file(filepath, source_base, path_map, worker_client, force_metadata)
+        extractors = {base: make_metadata_extractor(base) for _, base, _ in all_files}
+        batcher = RegistrationBatcher(client, index)
+
+        # httpx.Client is thread-safe: all workers share one connection pool.
+        # Files are submitted in chunks so the pool handles N/64 futures, not N.
+        def worker_task(batch):
+            results = []
+            for filepath, source_base, st in batch:
+                try:
+                    results.append(process_single_file(
+                        filepath, source_base, index, batcher, force_metadata, extractors[source_base], st
+                    ))
+                except Exception as e:
+                    results.append((filepath, "error", f"exception: {e}"))
+            return results
 
+        batches = [all_files[j:j + SCAN_TASK_CHUNK] for j in range(0, total_to_check, SCAN_TASK_CHUNK)]
         with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            futures = {executor.submit(worker_task, args): args for args in all_files}
-            for i, future in enumerate(as_completed(futures), 1):
+            futures = {executor.submit(worker_task, batch): batch for batch in batches}
+            i = 0
+            log_every = max(1, total_to_check // 100)
+            debug = logger.isEnabledFor(logging.DEBUG)
+            for future in as_completed(futures):
                 try:
-                    path, action, message = future.result()
+                    results = future.result()
+                except Exception as e:
+                    results = [(path, "error", f"exception: {e}") for path, _, _ in futures[future]]
+                for path, action, message in results:
+                    i += 1
                     if action == "registered":
                         stats.registered += 1
-                        logger.info(f"[{i}/{stats.total_files}] REG: {path}: {message}")
+                        if debug:
+                            logger.debug(f"[{i}/{total_to_check}] REG: {path}: {message}")
+                    elif action == "updated":
+                        stats.updated += 1
+                        if debug:
+                            logger.debug(f"[{i}/{total_to_check}] UPD: {path}: {message}")
                     elif action == "unchanged":
                         stats.skipped_unchanged += 1
                     elif action == "skipped":
                         stats.skipped_security += 1
-                        logger.warning(f"[{i}/{stats.total_files}] SKIP: {path}: {message}")
+                        logger.warning(f"[{i}/{total_to_check}] SKIP: {path}: {message}")
                     else:
                         stats.errors += 1
-                        logger.warning(f"[{i}/{stats.total_files}] ERR: {path}: {message}")
-                except Exception as e:
-                    stats.errors += 1
-                    logger.error(f"[{i}/{stats.total_files}] EXC: {e}")
-
-                if i % max(1, stats.total_files // 10) == 0:
-                    logger.info(f"Full scan progress: {i*100//stats.total_files}%")
-
-    # Soft-delete cleanup
+                        logger.warning(f"[{i}/{total_to_check}] ERR: {path}: {message}")
+
+                    if i % log_every == 0:
+                        logger.info(f"Full scan progress: {i*100//total_to_check}% ({stats.registered} registered, {stats.updated} updated)")
+
+        batcher.flush()
+        failed = sum(batcher.failed.values())
+        if failed:
+            # Already counted as registered/updated when queued
+            stats.registered -= batcher.failed["registered"]
+            stats.updated -= batcher.failed["updated"]
+            stats.errors += failed
+            logger.warning(f"Full scan: {failed} registrations failed to write")
+
+    # Soft-delete cleanup: live DB rows under a scanned source that the walk did
+    # not see. Set difference on the map loaded at scan start - no clock race with
+    # last_seen_at, and unmounted source paths are never reconciled.
     logger.info("Full scan: Marking deleted files...")
-    for source_path_str in source_paths:
-        normalized_source = normalize_path(source_path_str)
-        deleted = client.mark_deleted(normalized_source, scan_start.isoformat())
-        stats.soft_deleted += deleted
-
+    prefixes = tuple(scanned_prefixes)
+    missing_ids = [
+        known.id for path, known in index.files.items()
+        if known.id is not None and path not in seen and path.startswith(prefixes)
+    ]
+    if missing_ids:
+        stats.soft_deleted += client.mark_deleted(missing_ids)
+
+    client.close()
     stats.end_time = time.time()
     return stats
 
 
-def process_watcher_events(events: list, source_paths: list[str]) -> tuple[int, int, int, int]:
+def process_watcher_events(events: list[PendingEvent], source_paths: list[str]) -> tuple[int, int, int, int]:
     """Process real-time events."""
-    from src.watcher import PendingEvent
-    
-    registered, unchanged, errors = 0, 0, 0
-    client = PostgRESTClient()
-    path_map = client.fetch_path_map()
-    source_bases = [Path(p) for p in source_paths]
-
-    def get_source_base(filepath: Path) -> Path | None:
-        for base in source_bases:
-            try:
-                filepath.relative_to(base)
-                return base
-            except ValueError:
-                continue
-        return None
-
-    for event in events:
-        event: PendingEvent
+    registered, updated, unchanged, errors = 0, 0, 0, 0
+    client = get_postgrest_client()
+    paths = [event.dest_path if event.dest_path else event.path for event in events]
+    # A watcher batch touches a handful of files: look up only their rows instead
+    # of downloading the whole path map. Content already stored under another
+    # path is then re-upserted into file_contents, which is idempotent.
+    index = FileIndex(client.fetch_known_files([normalize_path(path) for path in paths]))
+    batcher = RegistrationBatcher(client, index)
+    source_bases = SourceBases(source_paths)
+    extractors = {str(Path(p)): make_metadata_extractor(str(Path(p))) for p in source_paths}
+
+    for event, path in zip(events, paths):
         try:
-            path = event.dest_path if event.dest_path else event.path
-            if path.exists():
-                source_base = get_source_base(path)
+            # One lstat per debounced event; the result is reused for security and metadata
+            st = stat_regular_file(path)
+            if st is not None:
+                source_base = source_bases.find(path)
                 if source_base:
-                    _, action, message = process_single_file(path, source_base, path_map, client)
+                    base = str(source_base)
+                    _, action, message = process_single_file(
+                        path, base, index, batcher, extract_metadata=extractors[base], st=st
+                    )
                     if action == "registered":
                         registered += 1
-                        logger.info(f"Watcher: {path.name}: {message}")
+                        logger.info(f"Watcher: {os.path.basename(path)}: {message}")
+                    elif action == "updated":
+                        updated += 1
                     elif action == "unchanged":
                         unchanged += 1
                     else:
                         errors += 1
-                        logger.warning(f"Watcher error: {path.name}: {message}")
+                        logger.warning(f"Watcher error: {os.path.basename(path)}: {message}")
         except Exception as e:
             errors += 1
             logger.error(f"Error processing event {event}: {e}")
 
-    return registered, 0, unchanged, errors
+    batcher.flush()
+    registered -= batcher.failed["registered"]
+    updated -= batcher.failed["updated"]
+    errors += sum(batcher.failed.values())
+
+    return registered, updated, unchanged, errors
@@ -1,108 +1,176 @@
 """S3 uploader with PostgREST queue management."""
+import os
+import threading
 import time
-import mimetypes
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from pathlib import Path
 
-from supabase import create_client, ClientOptions
-
 from src import settings
 from src.logging_conf import logger
 from src.postgrest import PostgRESTClient
+from src.storage import KEEPALIVE_EXPIRY, StorageClient
+from src.sync import HASH_CHUNK_SIZE, advise_dontneed, advise_sequential, content_hasher, guess_mime_type
+
+# Files at least this large get a HEAD check before their body is sent
+PREFLIGHT_MIN_SIZE = 1024 * 1024
+# Hashes recently confirmed in storage (insertion-ordered, oldest evicted first)
+KNOWN_PRESENT_MAX = 10_000
 
-# Memory limit for NAS devices
-MAX_UPLOAD_SIZE_MB = 100
-MAX_UPLOAD_SIZE_BYTES = MAX_UPLOAD_SIZE_MB * 1024 * 1024
-
-
-def get_storage_client():
-    """
-    Get Supabase client for S3 storage operations.
-    
-    TODO: This uses service_role key which has full DB access.
-    Options to fix:
-    1. Direct S3/MinIO access with storage-only credentials
-    2. Pre-signed URL generation from server
-    3. Storage-only JWT token
-    
-    For now, we use this for storage ONLY - DB operations go through PostgREST.
-    """
-    return create_client(
-        settings.SUPABASE_URL,
-        settings.SUPABASE_SERVICE_KEY,
-        options=ClientOptions(storage_client_timeout=120)
-    )
+
+def read_chunks(f, hasher):
+    """Yield a file in chunks, feeding each chunk to hasher as it is sent."""
+    advise_sequential(f.fileno())
+    while chunk := f.read(HASH_CHUNK_SIZE):
+        hasher.update(chunk)
+        yield chunk
+    advise_dontneed(f.fileno())
 
 
 class Uploader:
     def __init__(self):
         self.running = True
         self.db = None  # PostgREST client for DB operations
-        self.storage = None  # Supabase client for S3 storage only
+        self.storage = None  # Storage API client for S3 storage only
+        # Uploads are bound by network latency, not CPU: run a batch's items side
+        # by side so one large file doesn't stall the rest (both clients are thread-safe)
+        self._pool = ThreadPoolExecutor(max_workers=settings.UPLOAD_CONCURRENCY, thread_name_prefix="upload")
+        self._present: dict[str, None] = {}
+        # Hashes whose stored object failed verification and could not be deleted:
+        # the next upload must overwrite it (upsert), not trust "already exists"
+        self._overwrite: set[str] = set()
+        self._present_lock = threading.Lock()
+        self._wake_event = threading.Event()
+
+    def wake(self):
+        """Cut the idle wait short (new content was just registered)."""
+        self._wake_event.set()
 
     def run(self):
         """Infinite loop to process the upload queue."""
         logger.info("Uploader thread started")
+        in_flight = set()
         while self.running:
             try:
                 if not self.db:
-                    self.db = PostgRESTClient()
+                    self.db = PostgRESTClient(keepalive_expiry=KEEPALIVE_EXPIRY)
                 if not self.storage:
-                    self.storage = get_storage_client()
+                    self.storage = StorageClient(max_connections=settings.UPLOAD_CONCURRENCY)
                 
-                batch = self.db.dequeue_upload_batch(5, settings.SYNC_SOURCE_PATHS)
+                # Dequeue only as many rows as there are free upload slots: every row
+                # marked 'uploading' starts at once instead of waiting behind a slow upload
+                free = settings.UPLOAD_CONCURRENCY - len(in_flight)
+                batch = self._dequeue_batch(free) if free > 0 else []
+                in_flight.update(self._pool.submit(self.process_upload, item) for item in batch)
                 
-                if not batch:
-                    time.sleep(10)
+                if in_flight:
+                    # Refill as soon as any upload finishes, so the dequeue RPC overlaps the
+                    # remaining transfers; the timeout picks up new rows during long uploads
+                    _, in_flight = wait(in_flight, timeout=10, return_when=FIRST_COMPLETED)
                     continue
                 
-                for item in batch:
-                    if not self.running:
-                        break
-                    self.process_upload(item)
+                # Idle poll, ended early by wake() when this process registers content
+                self._wake_event.wait(timeout=10)
+                self._wake_event.clear()
                     
             except Exception as e:
                 logger.error(f"Uploader loop error: {e}")
                 time.sleep(10)
-                self.db = None
-                self.storage = None
+                # Let running uploads finish before their clients are closed
+                wait(in_flight)
+                in_flight = set()
+                self._close_clients()
+
+    def _close_clients(self):
+        """Close and drop both clients (and their connection pools); the loop reconnects."""
+        for client in (self.db, self.storage):
+            if client:
+                try:
+                    client.close()
+                except Exception:
+                    pass
+        self.db = None
+        self.storage = None
+
+    def _remember_present(self, content_hash: str):
+        with self._present_lock:
+            self._present[content_hash] = None
+            if len(self._present) > KNOWN_PRESENT_MAX:
+                del self._present[next(iter(self._present))]
+
+    def _dequeue_batch(self, batch_size: int) -> list[dict]:
+        return self.db.dequeue_upload_batch(batch_size, settings.SYNC_SOURCE_PATHS)
 
     def process_upload(self, item):
         content_hash = item["content_hash"]
         full_path = item["full_path"]
         local_path = Path(full_path)
+        # Same lookup the scanner registers mime_type with
+        content_type = guess_mime_type(full_path) or "application/octet-stream"
         
         try:
-            # Check file exists
-            if not local_path.exists():
+            with self._present_lock:
+                overwrite = content_hash in self._overwrite
+
+            # Already stored under its CAS key (retry, or duplicate content queued twice)
+            if not overwrite and content_hash in self._present:
+                self.db.mark_upload_complete(content_hash, content_hash, content_type)
+                logger.info(f"✓ Already stored: {content_hash[:10]}... ({local_path.name})")
+                return
+
+            # Open once and fstat the handle: one path lookup instead of
+            # exists() + stat() + open(), and size and bytes come from the same file
+            try:
+                # Unbuffered: read_chunks pulls 1MB per read() syscall straight
+                # from the kernel, with no 8KB BufferedReader layer in between
+                f = open(local_path, 'rb', buffering=0)
+            except FileNotFoundError:
                 self.db.mark_upload_failed(content_hash, "File missing on disk")
                 logger.warning(f"⊘ Missing: {local_path.name}")
                 return
 
-            # Check file size
-            actual_size = local_path.stat().st_size
-            if actual_size > MAX_UPLOAD_SIZE_BYTES:
-                size_mb = actual_size / 1024 / 1024
-                reason = f"File too large: {size_mb:.0f}MB (max {MAX_UPLOAD_SIZE_MB}MB)"
-                self.db.mark_upload_skipped(content_hash, reason)
-                logger.info(f"⊘ Skipped: {local_path.name} - {reason}")
-                return
+            with f:
+                # No size cap: the body is streamed, so memory stays at one chunk per upload
+                actual_size = os.fstat(f.fileno()).st_size
 
-            content_type, _ = mimetypes.guess_type(str(local_path))
-            
-            with open(local_path, 'rb') as f:
-                file_data = f.read()
+                # A HEAD round trip is cheaper than sending a large body the
+                # server would reject as a duplicate
+                if not overwrite and actual_size >= PREFLIGHT_MIN_SIZE and self.storage.exists(content_hash):
+                    created = False
+                else:
+                    # Stream the body straight from the file (memory bounded by one chunk)
+                    # and hash the same bytes as they go out. Without upsert an existing
+                    # object is never overwritten: under a CAS key it already holds this content.
+                    hasher = content_hasher()
+                    created = self.storage.upload(content_hash, read_chunks(f, hasher), content_type, upsert=overwrite)
+
+            # Content stored under a CAS key must match the key
+            if created and hasher.digest() != bytes.fromhex(content_hash):
+                if self.storage.delete(content_hash):
+                    with self._present_lock:
+                        self._overwrite.discard(content_hash)
+                    reason = "Content changed since registration"
+                else:
+                    # The wrong bytes stay under the CAS key: overwrite them on the next attempt
+                    with self._present_lock:
+                        self._overwrite.add(content_hash)
+                    reason = "Content changed since registration; mismatched object could not be deleted"
+                    logger.error(f"✗ Mismatched object left in storage: {content_hash[:10]}... ({local_path.name})")
+                self.db.mark_upload_failed(content_hash, reason)
+                logger.warning(f"⊘ Changed: {local_path.name} - content no longer matches {content_hash[:10]}...")
+                return
             
-            # Upload to S3 storage (uses Supabase client)
-            self.storage.storage.from_(settings.S3_BUCKET).upload(
-                path=content_hash,
-                file=file_data,
-                file_options={"content-type": content_type or "application/octet-stream", "upsert": "true"}
-            )
+            if overwrite:
+                with self._present_lock:
+                    self._overwrite.discard(content_hash)
             
             # Mark complete via PostgREST
-            self.db.mark_upload_complete(content_hash, content_hash, content_type or "application/octet-stream")
+            self.db.mark_upload_complete(content_hash, content_hash, content_type)
+            self._remember_present(content_hash)
             
-            logger.info(f"✓ Uploaded: {content_hash[:10]}... ({len(file_data) / 1024 / 1024:.1f}MB, {local_path.name})")
+            if created:
+                logger.info(f"✓ Uploaded: {content_hash[:10]}... ({actual_size / 1024 / 1024:.1f}MB, {local_path.name})")
+            else:
+                logger.info(f"✓ Already stored: {content_hash[:10]}... ({local_path.name})")
 
         except Exception as e:
             error_msg = str(e)[:500]
@@ -113,7 +181,7 @@ class Uploader:
         """Reset any uploads stuck in 'uploading' state (called on startup)."""
         try:
             if not self.db:
-                self.db = PostgRESTClient()
+                self.db = PostgRESTClient(keepalive_expiry=KEEPALIVE_EXPIRY)
             count = self.db.reset_stuck_uploads()
             if count:
                 logger.info(f"Reset {count} stuck uploads on startup")
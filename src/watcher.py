@@ -3,8 +3,12 @@ Filesystem watcher with debouncing for real-time file sync.
 Uses watchdog (cross-platform: inotify on Linux, FSEvents on macOS).
 """
 
+import bisect
 import fnmatch
+import heapq
 import os
+import re
+import sqlite3
 import threading
 import time
 from dataclasses import dataclass, field
@@ -20,6 +24,9 @@ from watchdog.events import FileSystemEventHandler, FileSystemEvent
 from src import settings
 from src.logging_conf import logger
 
+# Longest the queue processor sleeps with nothing pending (it is woken early by new events and stop())
+QUEUE_IDLE_WAIT = 30.0
+
 
 class EventType(Enum):
     CREATED = "created"
@@ -30,42 +37,178 @@ class EventType(Enum):
 @dataclass
 class PendingEvent:
     """A file event waiting to be processed after debounce window."""
-    path: Path
+    path: str  # Plain strings as watchdog reports them: no Path objects per raw event
     event_type: EventType
     timestamp: float
-    dest_path: Path | None = None  # For move events
+    dest_path: str | None = None  # For move events
 
 
 @dataclass
 class EventQueue:
-    """Thread-safe in-memory queue with debouncing."""
+    """
+    Thread-safe queue with debouncing.
+
+    Events live in memory up to max_events; beyond that the oldest half is spilled
+    to a SQLite file (if spill_path is set) and drained back in pages once due.
+    get_ready never returns more than max_events, so an event storm (recursive
+    chmod/touch) is handed to the processor in bounded batches.
+    """
     debounce_seconds: float
+    max_events: int = 50_000
+    spill_path: Path | None = None
     _events: dict = field(default_factory=dict)  # path -> PendingEvent
+    # (ready deadline, path) min-heap; entries of replaced events go stale and are skipped
+    _deadlines: list = field(default_factory=list)
     _lock: threading.Lock = field(default_factory=threading.Lock)
 
+    def __post_init__(self):
+        self._cond = threading.Condition(self._lock)
+        self._spill: sqlite3.Connection | None = None
+        self._spilled = 0  # rows in the spill table
+        self._spill_min_ts: float | None = None  # oldest spilled timestamp, for wait_for_ready
+        # Events left over from a previous run are drained like fresh spills
+        if self.spill_path and self.spill_path.exists():
+            self._open_spill()
+
+    def _open_spill(self) -> None:
+        try:
+            self._connect_spill()
+        except sqlite3.DatabaseError as e:
+            # A corrupt spill (e.g. after a power cut) must not stop the watcher:
+            # set it aside and start empty; the next full scan covers lost events
+            logger.error(f"Unreadable event spill {self.spill_path}: {e} - starting with an empty spill")
+            if self._spill is not None:
+                self._spill.close()
+            os.replace(self.spill_path, f"{self.spill_path}.corrupt")
+            for suffix in ("-wal", "-shm"):
+                try:
+                    os.remove(f"{self.spill_path}{suffix}")
+                except FileNotFoundError:
+                    pass
+            self._connect_spill()
+
+    def _connect_spill(self) -> None:
+        # Accessed only under self._lock, from whichever thread holds it
+        self._spill = sqlite3.connect(str(self.spill_path), check_same_thread=False)
+        self._spill.execute("PRAGMA journal_mode=WAL")
+        self._spill.execute("PRAGMA synchronous=NORMAL")  # WAL + NORMAL: no corruption on power loss
+        self._spill.execute(
+            "CREATE TABLE IF NOT EXISTS spill (path TEXT PRIMARY KEY, type TEXT, ts REAL, dest TEXT)"
+        )
+        self._spill.execute("CREATE INDEX IF NOT EXISTS spill_ts ON spill (ts)")
+        self._count_spill()
+
+    def _count_spill(self) -> None:
+        self._spilled, self._spill_min_ts = self._spill.execute("SELECT COUNT(*), MIN(ts) FROM spill").fetchone()
+
+    def _rebuild_deadlines(self) -> None:
+        """Rebuild the heap from the in-memory events, dropping stale entries (lock held)."""
+        self._deadlines = [(e.timestamp + self.debounce_seconds, e.path) for e in self._events.values()]
+        heapq.heapify(self._deadlines)
+
+    def _spill_oldest(self) -> None:
+        """Move the oldest half of the in-memory events to the spill table (lock held)."""
+        if self._spill is None:
+            self._open_spill()
+        oldest = heapq.nsmallest(self.max_events // 2, self._events.values(), key=lambda e: e.timestamp)
+        with self._spill:
+            self._spill.executemany(
+                "INSERT OR REPLACE INTO spill VALUES (?, ?, ?, ?)",
+                [(e.path, e.event_type.value, e.timestamp, e.dest_path) for e in oldest],
+            )
+        for event in oldest:
+            del self._events[event.path]
+        self._rebuild_deadlines()
+        self._count_spill()
+        logger.warning(f"Event queue over {self.max_events} events: spilled {len(oldest)} to {self.spill_path}")
+
+    def _drain_spill(self, cutoff: float, limit: int) -> list[PendingEvent]:
+        """Pop up to limit spilled events older than cutoff, oldest first (lock held).
+
+        A newer in-memory event for the same path wins.
+        """
+        with self._spill:
+            rows = self._spill.execute(
+                "SELECT rowid, path, type, ts, dest FROM spill WHERE ts < ? ORDER BY ts LIMIT ?", (cutoff, limit)
+            ).fetchall()
+            self._spill.executemany("DELETE FROM spill WHERE rowid = ?", [(row[0],) for row in rows])
+        self._count_spill()
+        return [
+            PendingEvent(path=path, event_type=EventType(type_), timestamp=ts, dest_path=dest)
+            for _, path, type_, ts, dest in rows
+            if path not in self._events
+        ]
+
     def add(self, event: PendingEvent) -> None:
         """Add or update an event (later events replace earlier ones for same path)."""
+        key = event.path
+        entry = (event.timestamp + self.debounce_seconds, key)
         with self._lock:
-            self._events[str(event.path)] = event
+            if self.spill_path and key not in self._events and len(self._events) >= self.max_events:
+                self._spill_oldest()
+            self._events[key] = event
+            heapq.heappush(self._deadlines, entry)
+            # Replacing an event leaves its old entry behind: keep the heap in proportion
+            if len(self._deadlines) > 2 * max(len(self._events), self.max_events):
+                self._rebuild_deadlines()
+            # Only a new earliest deadline changes how long the processor must sleep
+            if self._deadlines[0] is entry:
+                self._cond.notify_all()
+
+    def wait_for_ready(self, max_wait: float) -> None:
+        """Block until the earliest pending event is due, an earlier one arrives, or max_wait passes."""
+        with self._cond:
+            deadlines = [self._deadlines[0][0]] if self._deadlines else []
+            if self._spill_min_ts is not None:
+                deadlines.append(self._spill_min_ts + self.debounce_seconds)
+            timeout = min(deadlines) - time.time() if deadlines else max_wait
+            if timeout > 0:
+                self._cond.wait(min(timeout, max_wait))
+
+    def wake(self) -> None:
+        """Wake any thread blocked in wait_for_ready."""
+        with self._cond:
+            self._cond.notify_all()
 
     def get_ready(self) -> list[PendingEvent]:
-        """Get events that have passed the debounce window."""
+        """Get up to max_events events that have passed the debounce window, oldest (spilled) first."""
         now = time.time()
-        cutoff = now - self.debounce_seconds
         ready = []
         with self._lock:
-            to_remove = []
-            for path, event in self._events.items():
-                if event.timestamp < cutoff:
+            if self._spilled:
+                ready.extend(self._drain_spill(now - self.debounce_seconds, self.max_events))
+            # Pops only due deadlines: cost follows the ready events, not all pending ones.
+            # Whatever is left over stays due, so wait_for_ready returns at once for the next batch.
+            while self._deadlines and self._deadlines[0][0] < now and len(ready) < self.max_events:
+                _, key = heapq.heappop(self._deadlines)
+                event = self._events.get(key)
+                if event is not None and event.timestamp + self.debounce_seconds < now:
                     ready.append(event)
-                    to_remove.append(path)
-            for path in to_remove:
-                del self._events[path]
+                    del self._events[key]
         return ready
 
     def pending_count(self) -> int:
         with self._lock:
-            return len(self._events)
+            return len(self._events) + self._spilled
+
+
+class SourceBases:
+    """Finds the source base a path lies under: sorted prefixes + bisect, no relative_to/ValueError per lookup."""
+
+    def __init__(self, source_paths: list):
+        entries = sorted((str(Path(p)).rstrip('/') + '/', Path(p)) for p in source_paths)
+        self._prefixes = [prefix for prefix, _ in entries]
+        self._bases = [base for _, base in entries]
+
+    def find(self, filepath: str) -> Path | None:
+        # Prefixes of filepath sort at or before it, longer (nested) ones after shorter
+        # ones: walking back from the insertion point, the first prefix hit is the innermost
+        i = bisect.bisect_right(self._prefixes, filepath)
+        while i:
+            i -= 1
+            if filepath.startswith(self._prefixes[i]):
+                return self._bases[i]
+        return None
 
 
 class SyncEventHandler(FileSystemEventHandler):
@@ -76,24 +219,17 @@ class SyncEventHandler(FileSystemEventHandler):
         self.queue = queue
         self.source_bases = source_bases
         self.ignore_patterns = ignore_patterns
+        # All patterns compiled into one regex per subject, instead of two fnmatch
+        # calls per pattern per event: the filename against each pattern, and the
+        # full path against "*pattern" or any hidden (dot-prefixed) component
+        self._name_re = re.compile("|".join(fnmatch.translate(p) for p in ignore_patterns)) if ignore_patterns else None
+        self._path_re = re.compile("|".join([*(fnmatch.translate(f"*{p}") for p in ignore_patterns), r"(?s:(?:.*/)?\.)"]))
 
     def _should_ignore(self, path: str) -> bool:
-        """Check if path matches any ignore pattern."""
-        path_obj = Path(path)
-        # Check filename and full path against patterns
-        for pattern in self.ignore_patterns:
-            if fnmatch.fnmatch(path_obj.name, pattern):
-                return True
-            if fnmatch.fnmatch(str(path_obj), f"*{pattern}"):
-                return True
-        # Ignore hidden files/dirs
-        if any(part.startswith('.') for part in path_obj.parts):
+        """Check if path matches any ignore pattern or is hidden."""
+        if self._name_re and self._name_re.match(os.path.basename(path)):
             return True
-        return False
-
-    def _is_file(self, path: str) -> bool:
-        """Check if path is a file (not directory)."""
-        return Path(path).is_file()
+        return self._path_re.match(path) is not None
 
     def on_created(self, event: FileSystemEvent) -> None:
         if self._should_ignore(event.src_path):
@@ -103,30 +239,26 @@ class SyncEventHandler(FileSystemEventHandler):
             # Directory created - scan for files inside (handles copy/move of folders with contents)
             # Short sleep to allow filesystem to settle/files to appear if it's a copy operation
             time.sleep(1.0)
-            self._scan_new_directory(Path(event.src_path))
+            self._scan_new_directory(event.src_path)
             return
         
-        # Wait a moment for file to be fully written
-        if not self._is_file(event.src_path):
-            return
+        # No stat here: the file is checked once when its debounced event is processed
         self.queue.add(PendingEvent(
-            path=Path(event.src_path),
+            path=event.src_path,
             event_type=EventType.CREATED,
             timestamp=time.time()
         ))
         logger.debug(f"Event: created {event.src_path}")
 
-    def _scan_new_directory(self, dir_path: Path) -> None:
+    def _scan_new_directory(self, dir_path: str) -> None:
         """Scan a newly created directory and queue all files inside."""
         try:
             for root, dirs, files in os.walk(dir_path):
                 # Filter out hidden directories
                 dirs[:] = [d for d in dirs if not d.startswith('.')]
                 for filename in files:
-                    filepath = Path(root) / filename
-                    if self._should_ignore(str(filepath)):
-                        continue
-                    if not filepath.is_file():
+                    filepath = os.path.join(root, filename)
+                    if self._should_ignore(filepath):
                         continue
                     self.queue.add(PendingEvent(
                         path=filepath,
@@ -140,10 +272,8 @@ class SyncEventHandler(FileSystemEventHandler):
     def on_modified(self, event: FileSystemEvent) -> None:
         if event.is_directory or self._should_ignore(event.src_path):
             return
-        if not self._is_file(event.src_path):
-            return
         self.queue.add(PendingEvent(
-            path=Path(event.src_path),
+            path=event.src_path,
             event_type=EventType.MODIFIED,
             timestamp=time.time()
         ))
@@ -156,7 +286,7 @@ class SyncEventHandler(FileSystemEventHandler):
         
         if event.is_directory:
             # Directory moved - scan for files inside
-            self._scan_new_directory(Path(event.dest_path))
+            self._scan_new_directory(event.dest_path)
             logger.debug(f"Event: directory moved {event.src_path} → {event.dest_path}")
             return
         
@@ -166,17 +296,17 @@ class SyncEventHandler(FileSystemEventHandler):
         if src_ignored:
             # Moved from ignored to watched = treat as created
             self.queue.add(PendingEvent(
-                path=Path(event.dest_path),
+                path=event.dest_path,
                 event_type=EventType.CREATED,
                 timestamp=time.time()
             ))
         else:
             # Normal move within watched area
             self.queue.add(PendingEvent(
-                path=Path(event.src_path),
+                path=event.src_path,
                 event_type=EventType.MOVED,
                 timestamp=time.time(),
-                dest_path=Path(event.dest_path)
+                dest_path=event.dest_path
             ))
         logger.debug(f"Event: moved {event.src_path} → {event.dest_path}")
 
@@ -189,11 +319,16 @@ class FileWatcher:
         source_paths: list[str],
         on_events_ready: Callable[[list[PendingEvent]], None],
         debounce_seconds: float = 3.0,
-        ignore_patterns: list[str] | None = None
+        ignore_patterns: list[str] | None = None,
+        max_events: int = 50_000
     ):
         self.source_paths = [Path(p) for p in source_paths]
         self.on_events_ready = on_events_ready
-        self.queue = EventQueue(debounce_seconds=debounce_seconds)
+        self.queue = EventQueue(
+            debounce_seconds=debounce_seconds,
+            max_events=max_events,
+            spill_path=settings.DATA_DIR / "watcher_spill.db",
+        )
         self.ignore_patterns = ignore_patterns or settings.IGNORE_PATTERNS
         
         # Use PollingObserver for better compatibility with Docker volumes and network shares
@@ -202,6 +337,8 @@ class FileWatcher:
         
         self._processor_thread: threading.Thread | None = None
         self._running = False
+        # Exception types whose traceback was already logged once
+        self._logged_exc_types: set[type] = set()
 
     def start(self) -> None:
         """Start watching all source paths."""
@@ -226,6 +363,7 @@ class FileWatcher:
     def stop(self) -> None:
         """Stop watching."""
         self._running = False
+        self.queue.wake()
         self.observer.stop()
         self.observer.join(timeout=5)
         if self._processor_thread:
@@ -236,21 +374,19 @@ class FileWatcher:
         """Continuously process ready events from the queue."""
         while self._running:
             try:
+                # Sleeps exactly until the next debounce deadline instead of polling
+                self.queue.wait_for_ready(QUEUE_IDLE_WAIT)
                 ready_events = self.queue.get_ready()
                 if ready_events:
                     logger.info(f"Processing {len(ready_events)} events (pending: {self.queue.pending_count()})")
                     self.on_events_ready(ready_events)
             except Exception as e:
-                logger.error(f"Error processing events: {e}", exc_info=True)
-            time.sleep(0.5)  # Check every 500ms
-
-    def get_source_base(self, filepath: Path) -> Path | None:
-        """Find which source base a file belongs to."""
-        for base in self.source_paths:
-            try:
-                filepath.relative_to(base)
-                return base
-            except ValueError:
-                continue
-        return None
+                # Full traceback once per exception type: an error storm repeating
+                # the same failure shouldn't spend its time formatting stack traces
+                first = type(e) not in self._logged_exc_types
+                self._logged_exc_types.add(type(e))
+                logger.error(f"Error processing events: {e}", exc_info=first)
+                # Back off: a failing get_ready leaves due deadlines in place, so
+                # wait_for_ready would return at once and the loop would spin
+                time.sleep(0.5)
 